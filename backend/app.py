@@ -1,19 +1,62 @@
 # app.py
+import asyncio
+import logging
+import multiprocessing
+import os
 import urllib.parse
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException
+import uuid
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
-from typing import Dict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
 from datetime import datetime
-import json
-from models import SessionLocal, init_db, User, Message
-from auth import get_password_hash, verify_password, create_access_token, decode_token
-
-# Initialize database tables
-init_db()
+import orjson
+import redis.asyncio as aioredis
+from sqlalchemy import select, bindparam
+from models import SessionLocal, engine, init_db, User, Message
+from schemas import SignupIn, MessageOut
+from auth import get_password_hash, verify_and_update_password, create_access_token, decode_token
 
 app = FastAPI()
 
+logger = logging.getLogger(__name__)
+
+# per-client outbound queue size; when full the oldest message is dropped
+SEND_QUEUE_SIZE = 64
+
+# set to share rooms across workers via Redis Pub/Sub; unset = single worker
+REDIS_URL = os.getenv("REDIS_URL")
+# seconds a worker's room membership survives without a heartbeat; a crashed
+# worker's users drop out of user_list after at most this long
+MEMBERS_TTL = 30
+# backoff bounds (seconds) when a room's Pub/Sub reader loses its connection
+REDIS_RETRY_MIN = 0.5
+REDIS_RETRY_MAX = 30.0
+
+# typing event payloads; %s is the JSON-quoted username
+TYPING_TMPL = b'{"type":"typing","username":%s}'
+STOP_TYPING_TMPL = b'{"type":"stop_typing","username":%s}'
+
+# typing events from one user are broadcast at most once per TYPING_DEBOUNCE
+# seconds; stop_typing is sent automatically after TYPING_TIMEOUT of silence
+TYPING_DEBOUNCE = 1.0
+TYPING_TIMEOUT = 2.0
+
+# newest messages per room kept in the Redis history cache
+HISTORY_CACHE_SIZE = 50
+# seconds before a backfilled history set is reloaded from the DB
+HISTORY_CACHE_TTL = 300
+
+# processes for password hashing; kept small to leave CPU for the event loop
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", min(2, os.cpu_count() or 1)))
+
+# write-behind: max messages per INSERT, and how long to let a batch fill (seconds)
+DB_WRITE_BATCH = 100
+DB_WRITE_WAIT = 0.05
+# pause before retrying a failed batch insert (seconds)
+DB_RETRY_WAIT = 1.0
+
 # Allow React frontend (development mode)
 app.add_middleware(
     CORSMiddleware,
@@ -26,100 +69,520 @@ app.add_middleware(
 # ----------------------------
 # Database Dependency
 # ----------------------------
-def get_db():
-    db = SessionLocal()
-    try:
+# One AsyncSession per request; it checks out a connection lazily, so this
+# is cheap. Message writes are batched by db_writer and use Core anyway.
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 # ----------------------------
 # Connection Manager for Rooms
 # ----------------------------
 class ConnectionManager:
     def __init__(self):
-        # room: {username: websocket}
-        self.rooms: Dict[str, Dict[str, WebSocket]] = {}
+        # room: {"sockets": [websocket], "users": [username], "queues": [send queue],
+        #        "writers": [writer task], "index": {username: slot}}
+        # the lists are parallel so broadcasts walk a flat list of queues;
+        # index gives O(1) lookup for swap-remove on disconnect
+        self.rooms: Dict[str, dict] = {}
+        # room: serialized user_list payload; dropped whenever membership changes
+        self.user_list_cache: Dict[str, bytes] = {}
+
+        # set on startup when REDIS_URL is configured; None means single-worker
+        # mode where broadcasts fan out locally without touching Redis
+        self.redis = None
+        # room: (pubsub, reader task) for rooms with local subscribers
+        self.channels: Dict[str, tuple] = {}
+        # serializes subscribe/unsubscribe so concurrent joins don't double-subscribe
+        self.channel_lock = asyncio.Lock()
+        # membership is tracked per worker: members:{room}:{worker_id} holds this
+        # worker's users (TTL, refreshed by _heartbeat) and workers:{room} indexes
+        # the workers with users in the room
+        self.worker_id = uuid.uuid4().hex
+        self.heartbeat_task: asyncio.Task = None
+
+        # (room, username): loop time of the last typing event broadcast
+        self.typing_last: Dict[tuple, float] = {}
+        # (room, username): pending automatic stop_typing timer
+        self.typing_stop: Dict[tuple, asyncio.TimerHandle] = {}
+        # strong refs to fire-and-forget broadcast tasks started from timers
+        self.background = set()
 
     async def connect(self, websocket: WebSocket, room: str, username: str):
         await websocket.accept()
 
         if room not in self.rooms:
-            self.rooms[room] = {}
-
-        self.rooms[room][username] = websocket
-
-    def disconnect(self, websocket: WebSocket, room: str, username: str):
-        if room in self.rooms and username in self.rooms[room]:
-            del self.rooms[room][username]
-
-            if not self.rooms[room]:
+            self.rooms[room] = {"sockets": [], "users": [], "queues": [], "writers": [], "index": {}}
+
+        # each client gets a bounded queue drained by its own writer task, so
+        # a slow client only delays (and eventually drops) its own messages
+        queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        writer = asyncio.create_task(self._writer(room, username, websocket, queue))
+
+        state = self.rooms[room]
+        slot = state["index"].get(username)
+        if slot is None:
+            state["index"][username] = len(state["sockets"])
+            state["sockets"].append(websocket)
+            state["users"].append(username)
+            state["queues"].append(queue)
+            state["writers"].append(writer)
+            self.user_list_cache.pop(room, None)
+        else:
+            # same user reconnecting replaces their old socket
+            state["writers"][slot].cancel()
+            state["sockets"][slot] = websocket
+            state["queues"][slot] = queue
+            state["writers"][slot] = writer
+
+        if self.redis is not None:
+            try:
+                await self._add_member(room, username)
+                async with self.channel_lock:
+                    if room not in self.channels:
+                        await self._subscribe(room)
+            except BaseException:
+                # undo the registration so a Redis failure doesn't leak the
+                # slot or its writer task
+                await self.disconnect(websocket, room, username)
+                raise
+
+    async def disconnect(self, websocket: WebSocket, room: str, username: str):
+        try:
+            await self._remove(room, username, websocket)
+        finally:
+            # local state goes even if dropping the Redis membership failed;
+            # the heartbeat rewrites this worker's members without the user
+            if room in self.rooms and not self.rooms[room]["sockets"]:
                 del self.rooms[room]
-
-    async def broadcast(self, room: str, message: str):
+                self.user_list_cache.pop(room, None)
+
+        # last local subscriber gone: stop listening for this room
+        async with self.channel_lock:
+            if room not in self.rooms and room in self.channels:
+                await self._unsubscribe(room)
+
+    async def broadcast(self, room: str, message: bytes):
+        if self.redis is None:
+            await self.fanout(room, message)
+        else:
+            # every worker (including this one) delivers via its reader task
+            await self.redis.publish(f"room:{room}", message)
+
+    async def fanout(self, room: str, message: bytes):
+        """Deliver a message to the sockets connected to this worker"""
         if room in self.rooms:
-            dead = []
-            for username, ws in self.rooms[room].items():
+            # messages are pre-encoded UTF-8 sent as binary frames (the client
+            # decodes them as text), so nothing is re-encoded per recipient
+            for queue in self.rooms[room]["queues"]:
                 try:
-                    await ws.send_text(message)
-                except:
-                    dead.append(username)
-
-            # clean broken sockets
-            for u in dead:
-                del self.rooms[room][u]
+                    queue.put_nowait(message)
+                except asyncio.QueueFull:
+                    # client isn't keeping up: drop its oldest pending message
+                    queue.get_nowait()
+                    queue.put_nowait(message)
 
     async def broadcast_user_list(self, room: str):
         """Send online user list to all clients in the room"""
-        if room not in self.rooms:
+        if self.redis is not None:
+            # membership spans all workers, so it can't be cached locally
+            users = await self._online_users(room)
+            payload = orjson.dumps({
+                "type": "user_list",
+                "users": users
+            })
+        elif room in self.rooms:
+            payload = self.user_list_cache.get(room)
+            if payload is None:
+                payload = orjson.dumps({
+                    "type": "user_list",
+                    "users": self.rooms[room]["users"]
+                })
+                self.user_list_cache[room] = payload
+        else:
             return
 
-        users = list(self.rooms[room].keys())
-        payload = {
-            "type": "user_list",
-            "users": users
-        }
+        await self.broadcast(room, payload)
+
+    async def typing(self, room: str, username: str, typing_msg: bytes, stop_typing_msg: bytes):
+        """Broadcast a typing event, coalescing repeats within TYPING_DEBOUNCE"""
+        key = (room, username)
+        loop = asyncio.get_running_loop()
 
-        for ws in self.rooms[room].values():
-            await ws.send_json(payload)
+        # every keystroke pushes back the automatic stop_typing
+        handle = self.typing_stop.pop(key, None)
+        if handle is not None:
+            handle.cancel()
+        self.typing_stop[key] = loop.call_later(
+            TYPING_TIMEOUT, self._auto_stop_typing, room, username, stop_typing_msg
+        )
+
+        now = loop.time()
+        if now - self.typing_last.get(key, float("-inf")) < TYPING_DEBOUNCE:
+            return
+        self.typing_last[key] = now
+
+        await self.broadcast(room, typing_msg)
+
+    def clear_typing(self, room: str, username: str) -> bool:
+        """Forget a user's typing state; True if a stop_typing was still pending"""
+        key = (room, username)
+        self.typing_last.pop(key, None)
+        handle = self.typing_stop.pop(key, None)
+        if handle is None:
+            return False
+        handle.cancel()
+        return True
+
+    def _auto_stop_typing(self, room: str, username: str, stop_typing_msg: bytes):
+        self.clear_typing(room, username)
+        task = asyncio.create_task(self.broadcast(room, stop_typing_msg))
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
+
+    def _members_key(self, room: str) -> str:
+        return f"members:{room}:{self.worker_id}"
+
+    async def _add_member(self, room: str, username: str):
+        pipe = self.redis.pipeline()
+        pipe.sadd(self._members_key(room), username)
+        pipe.expire(self._members_key(room), MEMBERS_TTL)
+        pipe.sadd(f"workers:{room}", self.worker_id)
+        await pipe.execute()
+
+    async def _drop_member(self, room: str, username: str):
+        pipe = self.redis.pipeline()
+        pipe.srem(self._members_key(room), username)
+        # last local user gone: this worker no longer has anyone in the room
+        if not self.rooms.get(room, {}).get("users"):
+            pipe.srem(f"workers:{room}", self.worker_id)
+        await pipe.execute()
+
+    async def _online_users(self, room: str):
+        """Union of the users each live worker reports; prunes expired workers"""
+        worker_ids = await self.redis.smembers(f"workers:{room}")
+        if not worker_ids:
+            return []
+
+        pipe = self.redis.pipeline(transaction=False)
+        for worker_id in worker_ids:
+            pipe.smembers(f"members:{room}:{worker_id.decode()}")
+        member_sets = await pipe.execute()
+
+        users = set()
+        dead = []
+        for worker_id, members in zip(worker_ids, member_sets):
+            if members:
+                users.update(members)
+            else:
+                # its key expired: the worker died without cleaning up
+                dead.append(worker_id)
+        if dead:
+            await self.redis.srem(f"workers:{room}", *dead)
+
+        return sorted(u.decode() for u in users)
+
+    async def prune_members(self):
+        """Drop workers whose membership expired from every room's index"""
+        async for key in self.redis.scan_iter(match="workers:*"):
+            await self._online_users(key.decode()[len("workers:"):])
+
+    async def release_members(self):
+        """Remove this worker's membership on graceful shutdown"""
+        pipe = self.redis.pipeline()
+        for room in self.rooms:
+            pipe.delete(self._members_key(room))
+            pipe.srem(f"workers:{room}", self.worker_id)
+        await pipe.execute()
+
+    async def _heartbeat(self):
+        """Rewrite this worker's membership from local state and refresh its TTLs"""
+        while True:
+            await asyncio.sleep(MEMBERS_TTL / 3)
+            try:
+                pipe = self.redis.pipeline()
+                for room, state in self.rooms.items():
+                    if state["users"]:
+                        # replacing the set also drops users whose SREM failed
+                        pipe.delete(self._members_key(room))
+                        pipe.sadd(self._members_key(room), *state["users"])
+                        pipe.expire(self._members_key(room), MEMBERS_TTL)
+                        pipe.sadd(f"workers:{room}", self.worker_id)
+                await pipe.execute()
+            except Exception:
+                logger.exception("membership heartbeat failed")
+
+    async def _subscribe(self, room: str):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(f"room:{room}")
+        task = asyncio.create_task(self._reader(room, pubsub))
+        self.channels[room] = (pubsub, task)
+
+    async def _unsubscribe(self, room: str):
+        pubsub, task = self.channels.pop(room)
+        task.cancel()
+        await pubsub.unsubscribe(f"room:{room}")
+        await pubsub.aclose()
+
+    async def _reader(self, room: str, pubsub):
+        """Relay messages published for a room to local sockets"""
+        delay = REDIS_RETRY_MIN
+        while True:
+            try:
+                async for msg in pubsub.listen():
+                    delay = REDIS_RETRY_MIN
+                    if msg["type"] == "message":
+                        await self.fanout(room, msg["data"])
+                return  # listen() ends once the channel is unsubscribed
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("redis reader for room %s failed, resubscribing in %.1fs", room, delay)
+
+            # back off and swap in a fresh subscription until one succeeds, so
+            # local clients resume receiving once Redis is reachable again
+            while True:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, REDIS_RETRY_MAX)
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                self.channels[room] = (pubsub, asyncio.current_task())
+                try:
+                    await pubsub.subscribe(f"room:{room}")
+                    break
+                except Exception:
+                    logger.exception("resubscribing to room %s failed, retrying in %.1fs", room, delay)
+
+    async def _writer(self, room: str, username: str, websocket: WebSocket, queue: asyncio.Queue):
+        """Send a client's queued messages; drop the client once a send fails"""
+        try:
+            while True:
+                message = await queue.get()
+                await websocket.send_bytes(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            await self._remove(room, username, websocket)
+
+    async def _remove(self, room: str, username: str, websocket: WebSocket) -> bool:
+        """Swap-remove a user's slot if it still holds this websocket"""
+        state = self.rooms.get(room)
+        if state is None:
+            return False
+
+        slot = state["index"].get(username)
+        # skip if the user has since reconnected with a new socket
+        if slot is None or state["sockets"][slot] is not websocket:
+            return False
+
+        # the writer may be the caller (its send failed); don't cancel it
+        # mid-cleanup, it returns right after this
+        writer = state["writers"][slot]
+        if writer is not asyncio.current_task():
+            writer.cancel()
+
+        # move the last entry into the freed slot, then pop the tail
+        last = len(state["sockets"]) - 1
+        if slot != last:
+            moved = state["users"][last]
+            for key in ("sockets", "users", "queues", "writers"):
+                state[key][slot] = state[key][last]
+            state["index"][moved] = slot
+        for key in ("sockets", "users", "queues", "writers"):
+            state[key].pop()
+        del state["index"][username]
+        self.user_list_cache.pop(room, None)
+
+        # membership in Redis is dropped wherever the slot is, so a client
+        # whose send failed doesn't linger in every worker's user list
+        if self.redis is not None:
+            await self._drop_member(room, username)
+        return True
 
 manager = ConnectionManager()
 
 # ----------------------------
-# Save Message to PostgreSQL
+# Save Messages to PostgreSQL (write-behind)
+# ----------------------------
+# hot-path statements use SQLAlchemy Core directly, skipping ORM
+# unit-of-work bookkeeping and row -> object hydration
+messages_table = Message.__table__
+MSG_INSERT = messages_table.insert()
+MSG_SELECT = (
+    select(messages_table.c.username, messages_table.c.content, messages_table.c.timestamp)
+    .where(messages_table.c.room == bindparam("room"))
+    .order_by(messages_table.c.timestamp.desc())
+    .limit(bindparam("limit"))
+)
+
+# chat messages are queued here and persisted by db_writer so the
+# websocket loop never waits on a commit before broadcasting
+msg_queue: asyncio.Queue = None
+db_writer_task: asyncio.Task = None
+
+
+async def save_messages(items):
+    """Insert a batch of message dicts in one round trip"""
+    async with engine.begin() as conn:
+        await conn.execute(MSG_INSERT, items)
+
+
+def drain_queue(limit: int = DB_WRITE_BATCH):
+    """Pull up to `limit` queued messages without waiting"""
+    items = []
+    while len(items) < limit and not msg_queue.empty():
+        items.append(msg_queue.get_nowait())
+    return items
+
+
+async def persist(items):
+    """Save a batch (retrying once), then extend the Redis history cache"""
+    try:
+        await save_messages(items)
+    except Exception:
+        logger.warning("saving %d messages failed, retrying", len(items), exc_info=True)
+        await asyncio.sleep(DB_RETRY_WAIT)
+        try:
+            await save_messages(items)
+        except Exception:
+            logger.exception("dropping %d messages after retry", len(items))
+            return
+
+    if manager.redis is not None:
+        try:
+            await cache_messages(items)
+        except Exception:
+            logger.exception("failed to cache %d messages", len(items))
+
+
+async def db_writer():
+    # runs until it takes the None sentinel put by stop_db_writer; a batch
+    # already taken off the queue is always written before returning
+    stopping = False
+    while not stopping:
+        first = await msg_queue.get()
+        if first is None:
+            break
+        items = [first]
+
+        # give a burst a moment to accumulate, then take what's there
+        await asyncio.sleep(DB_WRITE_WAIT)
+        for item in drain_queue(DB_WRITE_BATCH - 1):
+            if item is None:
+                stopping = True
+            else:
+                items.append(item)
+
+        await persist(items)
+
+
+# ----------------------------
+# Database Setup
+# ----------------------------
+@app.on_event("startup")
+async def start_db():
+    # Initialize database tables
+    await init_db()
+
+# ----------------------------
+# Write-behind Worker
+# ----------------------------
+@app.on_event("startup")
+async def start_db_writer():
+    global msg_queue, db_writer_task
+    msg_queue = asyncio.Queue()
+    db_writer_task = asyncio.create_task(db_writer())
+
+
+# registered before the Redis/hash-pool handlers so the final flush can
+# still update the history cache
+@app.on_event("shutdown")
+async def stop_db_writer():
+    # let the writer finish its in-flight batch rather than cancelling it
+    msg_queue.put_nowait(None)
+    await db_writer_task
+
+    # flush anything queued after the writer stopped
+    while not msg_queue.empty():
+        items = [item for item in drain_queue() if item is not None]
+        if items:
+            await persist(items)
+
+    await engine.dispose()
+
+# ----------------------------
+# Redis Pub/Sub (multi-worker)
+# ----------------------------
+@app.on_event("startup")
+async def start_redis():
+    if REDIS_URL:
+        manager.redis = aioredis.from_url(REDIS_URL)
+        # clear out users left behind by workers that died
+        await manager.prune_members()
+        manager.heartbeat_task = asyncio.create_task(manager._heartbeat())
+
+
+@app.on_event("shutdown")
+async def stop_redis():
+    if manager.redis is not None:
+        manager.heartbeat_task.cancel()
+        await manager.release_members()
+        for room in list(manager.channels):
+            await manager._unsubscribe(room)
+        await manager.redis.aclose()
+
+# ----------------------------
+# Password Hashing Pool
 # ----------------------------
-def save_message(room: str, username: str, content: str):
-    db = SessionLocal()
-    msg = Message(
-        room=room,
-        username=username,
-        content=content,
-        timestamp=datetime.utcnow()
+# argon2/bcrypt are CPU-bound; separate processes let concurrent logins
+# hash in parallel instead of contending on the GIL in the threadpool
+hash_pool: ProcessPoolExecutor = None
+
+
+async def run_hash(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(hash_pool, func, *args)
+
+
+@app.on_event("startup")
+async def start_hash_pool():
+    global hash_pool
+    # spawn, not fork: forking a process that already runs threads is unsafe
+    hash_pool = ProcessPoolExecutor(
+        max_workers=HASH_WORKERS,
+        mp_context=multiprocessing.get_context("spawn")
     )
-    db.add(msg)
-    db.commit()
-    db.close()
+
+
+@app.on_event("shutdown")
+async def stop_hash_pool():
+    # waiting here would block the event loop until in-flight hashes finish
+    hash_pool.shutdown(wait=False, cancel_futures=True)
 
 # ----------------------------
 # Signup Endpoint
 # ----------------------------
 @app.post("/signup")
-def signup(data: dict, db=Depends(get_db)):
-    username = data.get("username")
-    password = data.get("password")
+async def signup(data: SignupIn, db=Depends(get_db)):
+    username = data.username
+    password = data.password
 
     if not username or not password:
         raise HTTPException(status_code=400, detail="username & password required")
 
     # check if user exists
-    existing = db.query(User).filter(User.username == username).first()
+    result = await db.execute(select(User).where(User.username == username))
+    existing = result.scalars().first()
     if existing:
         raise HTTPException(status_code=400, detail="username already exists")
 
-    hashed_pw = get_password_hash(password)
+    # hashing is CPU-bound; keep it off the event loop
+    hashed_pw = await run_hash(get_password_hash, password)
     user = User(username=username, hashed_password=hashed_pw)
     db.add(user)
-    db.commit()
+    await db.commit()
 
     # generate token
     token = create_access_token({"sub": username})
@@ -129,42 +592,112 @@ def signup(data: dict, db=Depends(get_db)):
 # Login Endpoint
 # ----------------------------
 @app.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db=Depends(get_db)):
-    user = db.query(User).filter(User.username == form_data.username).first()
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db=Depends(get_db)):
+    result = await db.execute(select(User).where(User.username == form_data.username))
+    user = result.scalars().first()
+    if not user:
+        raise HTTPException(status_code=401, detail="Incorrect username or password")
 
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    verified, new_hash = await run_hash(
+        verify_and_update_password, form_data.password, user.hashed_password
+    )
+    if not verified:
         raise HTTPException(status_code=401, detail="Incorrect username or password")
 
+    # migrate legacy bcrypt hashes to argon2id
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+
     token = create_access_token({"sub": form_data.username})
     return {"access_token": token, "token_type": "bearer"}
 
 # ----------------------------
 # Fetch Chat History
 # ----------------------------
-@app.get("/messages/{room}")
-def get_messages(room: str, limit: int = 50):
-    db = SessionLocal()
-    msgs = (
-        db.query(Message)
-        .filter(Message.room == room)
-        .order_by(Message.timestamp.asc())
-        .limit(limit)
-        .all()
-    )
-    db.close()
-
-    return [
-        {
-            "username": m.username,
-            "content": m.content,
-            "timestamp": m.timestamp.isoformat()
-        }
-        for m in msgs
-    ]
+def history_entry(username: str, content: str, timestamp: datetime) -> bytes:
+    # MessageOut owns the payload shape for both the cache and the DB path
+    return MessageOut(username=username, content=content, timestamp=timestamp).model_dump_json().encode()
+
+
+async def load_history(room: str, limit: int):
+    """Newest-first (username, content, timestamp) rows of a room"""
+    async with engine.connect() as conn:
+        return (await conn.execute(MSG_SELECT, {"room": room, "limit": limit})).all()
+
+
+def add_history(pipe, room: str, username: str, content: str, timestamp: datetime):
+    """Queue a ZADD of one message onto the room's history set, scored by send time"""
+    # the same message always serializes to the same member, so adding it
+    # again (from a push and a backfill) is a no-op instead of a duplicate
+    pipe.zadd(f"hist:{room}", {history_entry(username, content, timestamp): timestamp.timestamp()})
+
+
+async def cache_messages(items):
+    """Add freshly saved messages to the per-room history sets in Redis"""
+    pipe = manager.redis.pipeline()
+    for item in items:
+        key = f"hist:{item['room']}"
+        add_history(pipe, item["room"], item["username"], item["content"], item["timestamp"])
+        # keep only the newest HISTORY_CACHE_SIZE entries
+        pipe.zremrangebyrank(key, 0, -HISTORY_CACHE_SIZE - 1)
+        pipe.expire(key, HISTORY_CACHE_TTL)
+    await pipe.execute()
+
+
+async def backfill_history(room: str, rows):
+    """Merge a DB snapshot into the room's history set and mark it complete"""
+    key = f"hist:{room}"
+    pipe = manager.redis.pipeline()
+    for username, content, timestamp in rows:
+        add_history(pipe, room, username, content, timestamp)
+    pipe.zremrangebyrank(key, 0, -HISTORY_CACHE_SIZE - 1)
+    pipe.expire(key, HISTORY_CACHE_TTL)
+    # pushes alone only hold messages sent since the key appeared; the set
+    # is served only while this marker says a backfill has filled it in.
+    # The set is rebuilt from the DB at least this often
+    pipe.set(f"histready:{room}", 1, ex=HISTORY_CACHE_TTL)
+    await pipe.execute()
+
+
+# entries are MessageOut JSON built by history_entry; returning them as a raw
+# Response skips re-serialization, response_model documents the shape
+@app.get("/messages/{room}", response_model=List[MessageOut])
+async def get_messages(room: str, limit: int = 50):
+    """Return the latest `limit` messages of a room, oldest first"""
+    if manager.redis is not None and 0 < limit <= HISTORY_CACHE_SIZE:
+        pipe = manager.redis.pipeline(transaction=False)
+        pipe.exists(f"histready:{room}")
+        pipe.zrevrange(f"hist:{room}", 0, limit - 1)
+        ready, entries = await pipe.execute()
+
+        if not ready:
+            # miss: load a full cache window from the DB and merge it with
+            # whatever pushes already landed, so none of them are lost
+            rows = await load_history(room, HISTORY_CACHE_SIZE)
+            await backfill_history(room, rows)
+            entries = [history_entry(*row) for row in rows[:limit]]
+    else:
+        entries = [history_entry(*row) for row in await load_history(room, limit)]
+
+    # entries are already JSON; join them instead of re-serializing
+    return Response(content=b"[" + b",".join(reversed(entries)) + b"]", media_type="application/json")
 
 # ----------------------------
 # WebSocket Endpoint with JWT
 # ----------------------------
+def parse_event_type(message: str):
+    """Return the "type" of a JSON event message, or None if it isn't one"""
+    try:
+        payload = orjson.loads(message)
+    except orjson.JSONDecodeError:
+        return None
+
+    if isinstance(payload, dict):
+        return payload.get("type")
+    return None
+
+
 @app.websocket("/ws/{room}/{username}")
 async def websocket_endpoint(websocket: WebSocket, room: str, username: str):
     # extract token
@@ -177,43 +710,63 @@ async def websocket_endpoint(websocket: WebSocket, room: str, username: str):
         await websocket.close(code=1008)
         return
 
-    # connect
-    await manager.connect(websocket, room, username)
-    await manager.broadcast(room, f"🟢 {username} joined room: {room}")
-    await manager.broadcast_user_list(room)
+    # typing events only vary by username, so build them once per connection
+    quoted_username = orjson.dumps(username)
+    typing_msg = TYPING_TMPL % quoted_username
+    stop_typing_msg = STOP_TYPING_TMPL % quoted_username
 
+    # connect
     try:
+        await manager.connect(websocket, room, username)
+        await manager.broadcast(room, f"🟢 {username} joined room: {room}".encode())
+        await manager.broadcast_user_list(room)
+
         while True:
             message = await websocket.receive_text()
 
-            # check if JSON typing event
-            try:
-                payload = json.loads(message)
-
-                if payload.get("type") == "typing":
-                # broadcast typing event to room
-                    await manager.broadcast(room, json.dumps({
-                        "type": "typing",
-                        "username": username
-                    }))
+            # typing events are JSON objects; plain chat text never needs parsing
+            if message[:1] == "{":
+                event_type = parse_event_type(message)
+
+                if event_type == "typing":
+                    # broadcast typing event to room (debounced)
+                    await manager.typing(room, username, typing_msg, stop_typing_msg)
                     continue
 
-                if payload.get("type") == "stop_typing":
+                if event_type == "stop_typing":
                     # broadcast typing stop event
-                    await manager.broadcast(room, json.dumps({
-                        "type": "stop_typing",
-                        "username": username
-                    }))
+                    manager.clear_typing(room, username)
+                    await manager.broadcast(room, stop_typing_msg)
                     continue
 
-            except:
-                pass  # not JSON → treat as chat message
-
-                # Normal chat message
-            save_message(room, username, message)
-            await manager.broadcast(room, f"{username}: {message}")
+            # Normal chat message
+            msg_queue.put_nowait({
+                "room": room,
+                "username": username,
+                "content": message,
+                "timestamp": datetime.utcnow()
+            })
+            await manager.broadcast(room, f"{username}: {message}".encode())
 
     except WebSocketDisconnect:
-        manager.disconnect(websocket, room, username)
-        await manager.broadcast(room, f"🔴 {username} left room: {room}")
+        pass
+    finally:
+        # runs on any exit, a failed connect included, so the slot, the
+        # Redis membership and the typing timer can't leak
+        was_typing = manager.clear_typing(room, username)
+        await manager.disconnect(websocket, room, username)
+        # don't leave a typing indicator behind for a user who left mid-word
+        if was_typing:
+            await manager.broadcast(room, stop_typing_msg)
+        await manager.broadcast(room, f"🔴 {username} left room: {room}".encode())
         await manager.broadcast_user_list(room)
+
+# ----------------------------
+# Entry Point
+# ----------------------------
+if __name__ == "__main__":
+    import uvicorn
+
+    # uvloop/httptools ship with uvicorn[standard]; pin them explicitly so a
+    # missing C extension fails loudly instead of silently using asyncio
+    uvicorn.run("app:app", host="0.0.0.0", port=8000, loop="uvloop", http="httptools", ws="websockets")
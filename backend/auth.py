@@ -1,17 +1,50 @@
 # auth.py
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 
-from jose import JWTError, jwt
+import jwt
+from cachetools import TTLCache
 from passlib.context import CryptContext
 from pydantic import BaseModel
 
-# secret — in production load from environment variable
-SECRET_KEY = "your-very-secret-key-change-me"
+# signing secret — required, set JWT_SECRET in the environment
+SECRET_KEY = os.environ["JWT_SECRET"]
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours (adjust as needed)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__truncate_error=True)
+# HMAC keyed once; decode_jwt_fast copies it per token to skip the key schedule
+_hmac_ctx = hmac.new(SECRET_KEY.encode(), digestmod=hashlib.sha256)
+
+# verified tokens: blake2b(token) -> (username, exp), so reconnects within the
+# TTL skip HMAC + JSON parsing. Keep the TTL below the shortest token lifetime;
+# entries are also checked against exp on every hit.
+TOKEN_CACHE_TTL = 60
+_tok_cache = TTLCache(maxsize=10_000, ttl=TOKEN_CACHE_TTL)
+
+# argon2id for new hashes; bcrypt stays listed so existing hashes still verify
+# and get upgraded on next login (see verify_and_update_password)
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__memory_cost=19456,
+    argon2__time_cost=2,
+    argon2__parallelism=1,
+    bcrypt__truncate_error=True,
+)
+
+# legacy logins depend on bcrypt hashes verifying and being flagged for
+# upgrade; check that once at import so a broken bcrypt backend (e.g. an
+# incompatible bcrypt release) fails at startup instead of 500ing logins
+_BCRYPT_CHECK_HASH = "$2b$04$KFl.PufS5.GgkO3jr9fjR.n2VvIs5TJC/.t.ahVu3btL9NLr001i2"
+_verified, _upgraded = pwd_context.verify_and_update("self-check", _BCRYPT_CHECK_HASH)
+if not _verified or not (_upgraded or "").startswith("$argon2id$"):
+    raise RuntimeError("bcrypt -> argon2 migration self-check failed")
 
 
 class TokenData(BaseModel):
@@ -22,6 +55,11 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(plain_password: str, hashed_password: str):
+    """Returns (verified, new_hash); new_hash is set when the stored hash is outdated"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
@@ -38,12 +76,50 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-def decode_token(token: str):
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def decode_jwt_fast(token: str) -> Optional[dict]:
+    """Verify an HS256 token and return its claims, or None if invalid/expired"""
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+        signing_input, _, signature = token.rpartition(".")
+        header_seg, _, payload_seg = signing_input.partition(".")
+
+        header = json.loads(_b64decode(header_seg))
+        if not isinstance(header, dict) or header.get("alg") != ALGORITHM:
             return None
-        return username
-    except JWTError:
+
+        mac = _hmac_ctx.copy()
+        mac.update(signing_input.encode())
+        if not hmac.compare_digest(mac.digest(), _b64decode(signature)):
+            return None
+
+        payload = json.loads(_b64decode(payload_seg))
+    except ValueError:  # bad base64 / JSON / non-ASCII input
+        return None
+
+    if not isinstance(payload, dict):
+        return None
+
+    exp = payload.get("exp")
+    if not isinstance(exp, (int, float)) or exp <= time.time():
+        return None
+    return payload
+
+
+def decode_token(token: str):
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    cached = _tok_cache.get(key)
+    if cached is not None and cached[1] > time.time():
+        return cached[0]
+
+    payload = decode_jwt_fast(token)
+    if payload is None:
+        return None
+
+    username: str = payload.get("sub")
+    if username is None:
         return None
+    _tok_cache[key] = (username, payload["exp"])
+    return username
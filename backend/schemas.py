@@ -0,0 +1,15 @@
+# schemas.py
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class SignupIn(BaseModel):
+    username: str
+    password: str
+
+
+class MessageOut(BaseModel):
+    username: str
+    content: str
+    timestamp: datetime
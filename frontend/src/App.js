@@ -64,9 +64,13 @@ function App() {
     }
     const t = encodeURIComponent(token);
     const socket = new WebSocket(`ws://localhost:8000/ws/${room}/${authUser}?token=${t}`);
+    // server sends UTF-8 text as binary frames
+    socket.binaryType = "arraybuffer";
+    const decoder = new TextDecoder();
 
     socket.onmessage = (event) => {
-      setMessages(prev => [...prev, event.data]);
+      const data = typeof event.data === "string" ? event.data : decoder.decode(event.data);
+      setMessages(prev => [...prev, data]);
     };
 
     socket.onopen = () => {